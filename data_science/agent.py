@@ -1,12 +1,14 @@
 """Root Orchestrator Agent for Data Science System - Following ADK Patterns."""
 
 import logging
+import re
+import threading
+from typing import Optional
 from dotenv import load_dotenv
-from google.adk.agents import LlmAgent
+from google.adk.agents import LlmAgent, SequentialAgent
 from google.adk.agents.callback_context import CallbackContext
-from google.adk.tools.agent_tool import AgentTool
+from google.adk.models import LlmRequest, LlmResponse
 from google.genai import types
-from google.adk.models.lite_llm import LiteLlm
 
 
 # Load environment
@@ -18,22 +20,53 @@ from .sub_agents.analytics.agent import get_analytics_agent
 
 # Import prompts
 from .prompts import get_root_instruction
-from .tools import load_mcp_config, get_model_config
+from .tools import (
+    BoundedAgentTool,
+    load_mcp_config,
+    get_model_config,
+    get_lite_llm_model,
+    query_needs_chart,
+)
 
 _logger = logging.getLogger(__name__)
 
-# Global configurations (loaded once)
-MCP_SERVERS = None
-MODEL_CONFIG = None
+# Analysis keywords follow the DECISION RULE in the root instruction.
+# Retrieval keywords are only explicit data-fetch requests: a 'retrieval'
+# query gets a smaller output budget, so generic words (what, which, show,
+# get) that also open explanatory questions must not trigger it. Both sets
+# live in one alternation so a query is classified in a single scan.
+_QUERY_KEYWORDS_RE = re.compile(
+    r"\b(?:"
+    r"(?P<analysis>analy[sz]e|analysis|trends?|compar(?:e|ison)|charts?|graphs?|plot|"
+    r"visuali[sz]e|breakdown|insights?|patterns?|metrics?|distribution)"
+    r"|(?P<retrieval>list|fetch|retrieve|look ?up|count|how many)"
+    r")\b"
+)
 
-def initialize_configurations():
-    """Load configurations once."""
-    global MCP_SERVERS, MODEL_CONFIG
-    if MCP_SERVERS is None:
-        MCP_SERVERS = load_mcp_config()
-    if MODEL_CONFIG is None:
-        MODEL_CONFIG = get_model_config()
-    return MCP_SERVERS, MODEL_CONFIG
+# Analysis queries with a small, well-defined result (top-N, a single
+# extreme or count) are dispatched straight to the analysis pipeline
+_SMALL_RESULT_RE = re.compile(
+    r"\b(?:(?:top|bottom)\s+\d+|highest|lowest|how many)\b"
+)
+_ANALYSIS_PIPELINE = "analysis_pipeline"
+
+# Retrieval-only answers are relayed summaries and rarely need the full budget
+_MAX_OUTPUT_TOKENS = {"retrieval": 1024}
+
+def determine_query_type(query: str) -> str:
+    """Classify a user query as 'analysis', 'retrieval' or 'general'."""
+    query_type = "general"
+    for match in _QUERY_KEYWORDS_RE.finditer(query.lower()):
+        if match.lastgroup == "analysis":
+            return "analysis"
+        query_type = "retrieval"
+    return query_type
+
+def determine_query_plan(query: str, query_type: str) -> str:
+    """Choose 'fused' (direct pipeline dispatch) or 'two_step' orchestration."""
+    if query_type == "analysis" and _SMALL_RESULT_RE.search(query.lower()):
+        return "fused"
+    return "two_step"
 
 def root_before_callback(callback_context: CallbackContext) -> None:
     """
@@ -46,7 +79,7 @@ def root_before_callback(callback_context: CallbackContext) -> None:
         if user_content and hasattr(user_content, 'parts') and user_content.parts:
             # Get the text from the first part
             user_query = user_content.parts[0].text
-            _logger.info(f"Root agent extracted query: '{user_query[:80]}...'")
+            _logger.info("Root agent extracted query: '%.80s...'", user_query)
         else:
             user_query = "Unknown query"
             _logger.warning("Could not extract user query from user_content")
@@ -54,67 +87,120 @@ def root_before_callback(callback_context: CallbackContext) -> None:
         # Store in session state for ALL sub-agents to access
         callback_context.state['original_user_query'] = user_query
         callback_context.state['current_query'] = user_query
+        query_type = determine_query_type(user_query)
+        callback_context.state['query_type'] = query_type
+        # The fused path hands the raw query to the pipeline, which sees no
+        # conversation history; follow-ups go through the orchestrator so it
+        # can write a self-contained request
+        events = callback_context.session.events
+        is_first_turn = (
+            not events or events[0].invocation_id == callback_context.invocation_id
+        )
+        callback_context.state['query_plan'] = (
+            determine_query_plan(user_query, query_type) if is_first_turn else "two_step"
+        )
+        callback_context.state['needs_chart'] = query_needs_chart(user_query)
+        # Sub-agents run by AgentTool get their own session; this scopes
+        # their caches to the user's conversation
+        callback_context.state['root_session_id'] = callback_context.session.id
         
-        _logger.info(f"Root agent stored query in state: {user_query}")
+        _logger.info("Root agent stored query in state: %s", user_query)
         
     except Exception as e:
-        _logger.error(f"Error in root_before_callback: {e}")
+        _logger.error("Error in root_before_callback: %s", e)
+
+def root_before_model_callback(
+    callback_context: CallbackContext, llm_request: LlmRequest
+) -> Optional[LlmResponse]:
+    """
+    Root agent model callback: Skip or right-size the orchestrator LLM call.
+
+    A 'fused' query's first turn is answered with a ready-made call to the
+    analysis pipeline, saving the planning round-trip; every other call gets
+    an output budget sized for the classified query.
+    """
+    state = callback_context.state
+    if state.get('query_plan') == "fused" and _ANALYSIS_PIPELINE in llm_request.tools_dict:
+        state['query_plan'] = "fused_dispatched"
+        _logger.info("Dispatching analysis query directly to %s", _ANALYSIS_PIPELINE)
+        return LlmResponse(
+            content=types.Content(
+                role="model",
+                parts=[
+                    types.Part(
+                        function_call=types.FunctionCall(
+                            name=_ANALYSIS_PIPELINE,
+                            args={"request": state.get('original_user_query', '')},
+                        )
+                    )
+                ],
+            )
+        )
+
+    max_tokens = _MAX_OUTPUT_TOKENS.get(state.get('query_type'))
+    if max_tokens and llm_request.config:
+        llm_request.config.max_output_tokens = max_tokens
+    return None
 
-def create_sub_agents() -> tuple:
+def create_sub_agents(enable_analytics: bool = True) -> tuple:
     """Create and return all sub-agents with proper configurations."""
-    global MCP_SERVERS, MODEL_CONFIG
-    
-    # Ensure configurations are loaded
-    if MCP_SERVERS is None or MODEL_CONFIG is None:
-        MCP_SERVERS, MODEL_CONFIG = initialize_configurations()
+    model_config = get_model_config()
     
     # Create retrieval agent with MCP tools
     retrieval_agent = get_retrieval_agent(
-        mcp_servers=MCP_SERVERS,
-        model_config=MODEL_CONFIG
+        mcp_servers=load_mcp_config(),
+        model_config=model_config
     )
     
+    if not enable_analytics:
+        return (retrieval_agent,)
+    
     # Create analytics agent
     analytics_agent = get_analytics_agent(
-        model_config=MODEL_CONFIG
+        model_config=model_config
     )
     
     return retrieval_agent, analytics_agent
 
-def get_root_agent() -> LlmAgent:
+def create_analysis_pipeline(retrieval_agent: LlmAgent, analytics_agent: LlmAgent) -> SequentialAgent:
+    """
+    Chain retrieval and analytics so one tool call answers an analysis query.
+
+    This saves the orchestrator LLM call between the two agent calls that
+    only forwards the retrieval summary; the orchestrator still runs once
+    after the pipeline to relay its result. The pipeline gets renamed clones,
+    since an agent can have only one parent and names must be unique.
+    """
+    return SequentialAgent(
+        name=_ANALYSIS_PIPELINE,
+        description="Retrieves the data for an analysis query, then returns the Analytics Agent's structured JSON",
+        sub_agents=[
+            retrieval_agent.clone({"name": f"{_ANALYSIS_PIPELINE}_{retrieval_agent.name}"}),
+            analytics_agent.clone({"name": f"{_ANALYSIS_PIPELINE}_{analytics_agent.name}"}),
+        ],
+    )
+
+def get_root_agent(enable_analytics: bool = True) -> LlmAgent:
     """Create and configure the root orchestrator agent."""
-    if MODEL_CONFIG["type"] == "deepseek":
-        model_instance = LiteLlm(
-            model="deepseek/deepseek-chat",
-            api_key=MODEL_CONFIG.get("api_key")
-        )
-    else:
-        model_instance = LiteLlm(
-            model=MODEL_CONFIG.get("model", "gemini-2.0-flash-exp"),
-            api_base=MODEL_CONFIG.get("api_base"),
-            api_key=MODEL_CONFIG.get("api_key", "EMPTY")
-        )
+    model_instance = get_lite_llm_model(get_model_config())
     # Create sub-agents
-    retrieval_agent, analytics_agent = create_sub_agents()
+    sub_agents = list(create_sub_agents(enable_analytics=enable_analytics))
     
     # Create AgentTools for the orchestrator to use
-    retrieval_tool = AgentTool(
-        agent=retrieval_agent,
-    )
-    
-    analytics_tool = AgentTool(
-        agent=analytics_agent,
-    )
+    agent_tools = [BoundedAgentTool(agent=sub_agent) for sub_agent in sub_agents]
+    if enable_analytics:
+        agent_tools.append(BoundedAgentTool(agent=create_analysis_pipeline(*sub_agents)))
     
     # Create the root agent
     agent = LlmAgent(
         name="data_science_orchestrator",
         model=model_instance,
-        instruction=get_root_instruction(),
+        instruction=get_root_instruction(enable_analytics),
         description="Orchestrates data retrieval and analysis workflows",
-        tools=[retrieval_tool, analytics_tool],
-        sub_agents=[retrieval_agent, analytics_agent],
+        tools=agent_tools,
+        sub_agents=sub_agents,
         before_agent_callback=root_before_callback,
+        before_model_callback=root_before_model_callback,
         generate_content_config=types.GenerateContentConfig(
             temperature=0.1,
             top_p=0.95,
@@ -122,17 +208,25 @@ def get_root_agent() -> LlmAgent:
         )
     )
     
-    _logger.info("=" * 60)
-    _logger.info("Data Science Agent System Initialized")
-    _logger.info(f"Root Agent: {agent.name}")
-    _logger.info(f"Sub-agents: {[a.name for a in agent.sub_agents]}")
-    _logger.info(f"MCP Servers: {len(MCP_SERVERS) if MCP_SERVERS else 0}")
-    _logger.info("=" * 60)
+    if _logger.isEnabledFor(logging.INFO):
+        _logger.info("=" * 60)
+        _logger.info("Data Science Agent System Initialized")
+        _logger.info("Root Agent: %s", agent.name)
+        _logger.info("Sub-agents: %s", [a.name for a in agent.sub_agents])
+        _logger.info("MCP Servers: %d", len(load_mcp_config()))
+        _logger.info("=" * 60)
     
     return agent
 
-# Initialize configurations early
-initialize_configurations()
+# Serializes the first root_agent build across threads; main.py builds it
+# at startup, before any request can reach ADK's agent loader
+_ROOT_AGENT_LOCK = threading.Lock()
 
-# Create the root agent instance for export
-root_agent = get_root_agent()
\ No newline at end of file
+def __getattr__(name: str):
+    """Build the exported root_agent on first access instead of at import."""
+    if name == "root_agent":
+        with _ROOT_AGENT_LOCK:
+            if "root_agent" not in globals():
+                globals()["root_agent"] = get_root_agent()
+        return globals()["root_agent"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,14 +2,14 @@
 
 import json
 import logging
-from typing import Dict, Any
+from typing import Any, Mapping
 from google.adk.agents import LlmAgent
 from google.genai import types
 
 from data_science.tools import get_lite_llm_model
 from .prompts import get_analytics_instruction
 
-def get_analytics_agent(model_config: Dict[str, Any]) -> LlmAgent:
+def get_analytics_agent(model_config: Mapping[str, Any]) -> LlmAgent:
     """Create the analytics and visualization agent (chart-only)."""
 
     model = get_lite_llm_model(model_config)
@@ -22,7 +22,7 @@ def get_analytics_agent(model_config: Dict[str, Any]) -> LlmAgent:
         output_key="analytics_output",
         generate_content_config=types.GenerateContentConfig(
             temperature=0.0,
-            max_output_tokens=4096
+            max_output_tokens=2048
         ),
     )
 
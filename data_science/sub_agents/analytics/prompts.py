@@ -1,5 +1,4 @@
-def get_analytics_instruction() -> str:
-    return """
+_ANALYTICS_INSTRUCTION = """
 YOU ARE AN ANALYTICS ENGINE.
 
 You will receive:
@@ -24,37 +23,13 @@ EXPECTED OUTPUT SCHEMA
 
 {
   "analysis_summary": string,
-
-  "entities": {
-    "customers": [
-      {
-        "id": number,
-        "name": string,
-        "metrics": {
-          "total_sales": number
-        }
-      }
-    ]
-  },
-
+  "entities": {"customers": [{"id": number, "name": string, "metrics": {"total_sales": number}}]},
   "aggregate_metrics": {},
-
   "comparisons": [],
-
   "time_series": [],
-
   "insights": [],
-
   "recommendations": [],
-
-  "visualization_hints": [
-    {
-      "chart_type": "bar" | "pie" | "line",
-      "x": [],
-      "y": [],
-      "title": string
-    }
-  ]
+  "visualization_hints": [{"chart_type": "bar" | "pie" | "line", "x": [], "y": [], "title": string}]
 }
 
 ====================
@@ -67,3 +42,7 @@ HARD RULES
 - Leave arrays empty if data is missing
 - All charts must be renderable without transformation
 """
+
+
+def get_analytics_instruction() -> str:
+    return _ANALYTICS_INSTRUCTION
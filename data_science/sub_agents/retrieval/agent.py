@@ -1,20 +1,60 @@
 """Data Retrieval Agent with MCP integration."""
 
+import os
+import re
+import json
+import reprlib
+import hashlib
 import logging
-from typing import Dict, Any, List
+import operator
+import itertools
+from typing import Dict, Any, Mapping, Optional, Sequence, Tuple
+from cachetools import TTLCache
 from google.adk.agents import Agent
 from google.adk.agents.callback_context import CallbackContext
+from google.genai import types
+from ...tools import McpBatchTool, mcp_tool_server_url, query_needs_chart
 from .prompts import get_retrieval_instruction
 
 _logger = logging.getLogger(__name__)
 
-def get_retrieval_agent(mcp_servers: List[Dict[str, Any]], 
-                       model_config: Dict[str, Any]) -> Agent:
+# Recent MCP tool responses keyed by (server URL, tool name, args hash)
+_RETRIEVAL_CACHE: TTLCache = TTLCache(
+    maxsize=1024, ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+)
+# Final retrieval answers keyed by a digest of (user, root session, request)
+_RESPONSE_CACHE: TTLCache = TTLCache(
+    maxsize=512, ttl=float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+)
+# Bounded previews of MCP payloads; never materializes the full repr
+_REPR = reprlib.Repr(maxlevel=3, maxstring=200, maxother=200, maxdict=10, maxlist=10)
+
+# Fallback source of the query when the root agent did not set it in state
+_GET_CURRENT_TEXT = operator.attrgetter('current_message.text')
+
+# Only tools the MCP server marks readOnlyHint are cached, plus any listed
+# here (comma-separated names) for servers that do not annotate their tools
+_CACHEABLE_TOOLS = frozenset(
+    name.strip()
+    for name in os.getenv("RETRIEVAL_CACHEABLE_TOOLS", "").split(",")
+    if name.strip()
+)
+
+def get_retrieval_agent(mcp_servers: Sequence[Mapping[str, Any]], 
+                       model_config: Mapping[str, Any]) -> Agent:
     """Create the data retrieval agent."""
     
     from ...tools import create_mcp_toolsets, get_lite_llm_model
     
     mcp_toolsets = create_mcp_toolsets(mcp_servers)
+    tools = list(mcp_toolsets)
+    if mcp_toolsets:
+        tools.append(McpBatchTool(
+            mcp_toolsets,
+            max_concurrency=int(os.getenv("MCP_BATCH_MAX_CONCURRENCY", "4")),
+            before_call=retrieval_before_tool_callback,
+            after_call=retrieval_after_tool_callback,
+        ))
     
     # Create model instance
     model = get_lite_llm_model(model_config)
@@ -24,72 +64,182 @@ def get_retrieval_agent(mcp_servers: List[Dict[str, Any]],
         model=model,
         instruction=get_retrieval_instruction(),
         description="Retrieves data from PostgreSQL, MSSQL, HubSpot, and metadata systems via MCP",
-        tools=mcp_toolsets,
+        tools=tools,
         output_key="retrieved_data",
         before_agent_callback=retrieval_before_callback,
+        after_agent_callback=retrieval_after_callback,
+        before_tool_callback=retrieval_before_tool_callback,
         after_tool_callback=retrieval_after_tool_callback
     )
     
     return agent
 
-def retrieval_before_callback(callback_context: CallbackContext) -> None:
-    """Retrieval agent callback: Extract query from state."""
-    try:
-        # Get the user query from session state (set by root agent)
-        user_query = callback_context.state.get('original_user_query', '')
-        
-        if user_query:
-            _logger.info(f"Retrieval agent processing query: '{user_query[:80]}...'")
-            # Store in agent-specific state
-            callback_context.state['retrieval_query'] = user_query
-        else:
-            _logger.warning("No user query found in state for retrieval agent")
-            # Try to get from current message as fallback
-            if hasattr(callback_context, 'current_message'):
-                current_msg = callback_context.current_message
-                if hasattr(current_msg, 'text'):
-                    callback_context.state['retrieval_query'] = current_msg.text
-                    _logger.info(f"Retrieval agent using current message: '{current_msg.text[:80]}...'")
-            
-    except Exception as e:
-        _logger.error(f"Error in retrieval_before_callback: {e}")
+def _response_cache_key(callback_context: CallbackContext) -> Optional[bytes]:
+    """
+    Digest of the request this retrieval run received, scoped to its session.
+
+    Under an AgentTool the run gets a fresh session, so the root session id
+    is taken from state (set by the root agent). None if there is no request.
+    """
+    user_content = callback_context.user_content
+    if not user_content or not user_content.parts:
+        return None
+    request = " ".join(" ".join(p.text for p in user_content.parts if p.text).split())
+    if not request:
+        return None
+    session_id = callback_context.state.get('root_session_id') or callback_context.session.id
+    scoped = "\0".join((callback_context.user_id, session_id, request.casefold()))
+    return hashlib.blake2b(scoped.encode(), digest_size=16).digest()
+
+def _is_error_response(tool_response: Any) -> bool:
+    """
+    True for failed MCP calls: an ``isError`` result or an ``error`` entry.
+
+    A ``batch_execute`` response counts as failed if any of its calls failed.
+    """
+    if not isinstance(tool_response, dict):
+        return False
+    if tool_response.get("isError") or tool_response.get("error"):
+        return True
+    return any(
+        _is_error_response(entry) or _is_error_response(entry.get("result"))
+        for entry in tool_response.get("results") or ()
+        if isinstance(entry, dict)
+    )
+
+def retrieval_before_callback(callback_context: CallbackContext) -> Optional[types.Content]:
+    """Retrieval agent callback: Extract query from state, answer repeats from cache."""
+    # Get the user query from session state (set by root agent)
+    user_query = callback_context.state.get('original_user_query', '')
+    callback_context.state['retrieval_cache_hit'] = False
+    # Tool outcomes of this run; only answers backed by successful calls are cached
+    callback_context.state['retrieval_tool_ok'] = False
+    callback_context.state['retrieval_tool_error'] = False
+    
+    if user_query:
+        _logger.info("Retrieval agent processing query: '%.80s...'", user_query)
+        # Store in agent-specific state
+        callback_context.state['retrieval_query'] = user_query
+
+        # Skip the LLM and MCP round-trips for a recently answered request
+        key = _response_cache_key(callback_context)
+        cached = _RESPONSE_CACHE.get(key) if key is not None else None
+        if cached is not None:
+            _logger.info("Retrieval response cache hit")
+            callback_context.state['retrieval_cache_hit'] = True
+            callback_context.state['retrieved_data'] = cached
+            return types.Content(role="model", parts=[types.Part(text=cached)])
+    else:
+        _logger.warning("No user query found in state for retrieval agent")
+        # Try to get from current message as fallback
+        try:
+            current_text = _GET_CURRENT_TEXT(callback_context)
+        except AttributeError:
+            current_text = None
+        if current_text is not None:
+            callback_context.state['retrieval_query'] = current_text
+            _logger.info("Retrieval agent using current message: '%.80s...'", current_text)
+
+def retrieval_after_callback(callback_context: CallbackContext) -> None:
+    """Cache the retrieval agent's final answer for repeats of the same request."""
+    state = callback_context.state
+    if state.get('retrieval_cache_hit'):
+        return None
+
+    # Clarification questions and error explanations come from runs with no
+    # successful tool call, or with a failed one; those are never cached
+    if not state.get('retrieval_tool_ok') or state.get('retrieval_tool_error'):
+        return None
+
+    answer = state.get('retrieved_data')
+    key = _response_cache_key(callback_context)
+    if key is not None and isinstance(answer, str) and answer:
+        _RESPONSE_CACHE[key] = answer
+    return None
+
+def _is_read_only_tool(tool) -> bool:
+    """True if the tool is declared read-only by its MCP server or allowlisted."""
+    if tool.name in _CACHEABLE_TOOLS:
+        return True
+    annotations = getattr(getattr(tool, "raw_mcp_tool", None), "annotations", None)
+    return bool(annotations and annotations.readOnlyHint)
+
+def _tool_cache_key(tool, args: Dict[str, Any]) -> Optional[Tuple[str, str, str]]:
+    """Build the retrieval cache key for a tool call, or None if not cacheable."""
+    server_url = mcp_tool_server_url(tool)
+    if server_url is None or not _is_read_only_tool(tool):
+        return None
+    args_json = json.dumps(args, sort_keys=True, default=str)
+    return (
+        server_url,
+        tool.name,
+        hashlib.blake2b(args_json.encode(), digest_size=16).hexdigest(),
+    )
+
+def retrieval_before_tool_callback(tool, args, tool_context):
+    """Serve repeated read-only tool calls from the retrieval cache."""
+    key = _tool_cache_key(tool, args)
+    if key is None:
+        return None
+
+    cached = _RETRIEVAL_CACHE.get(key)
+    if cached is not None:
+        _logger.info("Retrieval cache hit for tool %s", tool.name)
+    return cached
+
+def _cache_tool_response(tool, args, tool_context, tool_response) -> None:
+    """Cache a successful read-only tool response."""
+    if not isinstance(tool_response, dict) or _is_error_response(tool_response):
+        return None
+    key = _tool_cache_key(tool, args)
+    if key is not None:
+        _RETRIEVAL_CACHE[key] = tool_response
+    return None
 
 def retrieval_after_tool_callback(tool, args, tool_context, tool_response):
-    """Store retrieval results in state."""
-    try:
-        if tool_response and isinstance(tool_response, dict):
-            formatted = format_retrieval_results(tool_response)
-
-            # Detect if user query implies chart/graph
-            user_query = tool_context.state.get('original_user_query', '')
-            needs_chart = any(
-                kw in user_query.lower()
-                for kw in ["chart", "graph", "plot", "visualize", 
-                           "bar", "line", "pie", "scatter", "histogram"]
-            )
-
-            # Store both in state, plus needs_chart flag
-            tool_context.state['retrieved_raw_data'] = formatted["raw"]
-            tool_context.state['retrieved_data'] = {
-                "structured": formatted["structured"],
-                "needs_chart": needs_chart
-            }
+    """Store retrieval results in state (also run per batched call)."""
+    if isinstance(tool, McpBatchTool):
+        # Its inner results already went through here one by one
+        return None
 
-            _logger.info("Retrieval results stored in state with needs_chart=%s", needs_chart)
+    if _is_error_response(tool_response):
+        # Keep whatever an earlier call stored in retrieved_data
+        tool_context.state['retrieval_tool_error'] = True
+        return None
+    if tool_response:
+        tool_context.state['retrieval_tool_ok'] = True
 
-    except Exception as e:
-        _logger.error(f"Error in retrieval_after_tool_callback: {e}")
+    if tool_response and isinstance(tool_response, dict):
+        _cache_tool_response(tool, args, tool_context, tool_response)
+
+        formatted = format_retrieval_results(tool_response, include_raw=False)
+
+        # Detect if user query implies chart/graph (set upstream by the root agent)
+        needs_chart = tool_context.state.get('needs_chart')
+        if needs_chart is None:
+            needs_chart = query_needs_chart(tool_context.state.get('original_user_query', ''))
+
+        # Store only the structured form; the raw preview is re-derivable
+        # from it and would double the payload ADK persists to the session
+        tool_context.state['retrieved_data'] = {
+            "structured": formatted["structured"],
+            "needs_chart": needs_chart
+        }
+
+        _logger.info("Retrieval results stored in state with needs_chart=%s", needs_chart)
 
     return None
 
 
-def format_retrieval_results(results: Dict[str, Any]) -> Dict[str, Any]:
+def format_retrieval_results(results: Dict[str, Any],
+                             include_raw: bool = True) -> Dict[str, Any]:
     """
     Format retrieval results for analytics agent consumption.
     
     Returns a dict with:
       - 'structured': JSON/table suitable for AnalyticsProcessor
       - 'raw': human-readable string for users who just want data
+        (left empty when include_raw is False)
     """
     try:
         output = {"structured": None, "raw": ""}
@@ -108,23 +258,29 @@ def format_retrieval_results(results: Dict[str, Any]) -> Dict[str, Any]:
             }
 
             # Raw text preview for user
-            sample_size = min(5, len(rows))
-            raw_text = f"Retrieved {len(rows)} rows with {len(columns)} columns\n"
-            raw_text += "Columns: " + ", ".join(columns) + "\n\n"
-            raw_text += f"Sample rows ({sample_size} of {len(rows)}):\n"
-            for i in range(sample_size):
-                raw_text += f"Row {i+1}: {dict(zip(columns, rows[i]))}\n"
-            output["raw"] = raw_text
+            if include_raw:
+                sample_size = min(5, len(rows))
+                sample_text = "".join(
+                    f"Row {i + 1}: " + ", ".join(f"{c}={v!r}" for c, v in zip(columns, row)) + "\n"
+                    for i, row in enumerate(itertools.islice(rows, sample_size))
+                )
+                output["raw"] = (
+                    f"Retrieved {len(rows)} rows with {len(columns)} columns\n"
+                    f"Columns: {', '.join(columns)}\n\n"
+                    f"Sample rows ({sample_size} of {len(rows)}):\n"
+                    f"{sample_text}"
+                )
 
         elif 'data' in results:
-            output["raw"] = str(results['data'])[:2000]
             output["structured"] = {"type": "json", "data": results['data']}
+            if include_raw:
+                output["raw"] = _REPR.repr(results['data'])[:2000]
 
-        else:
-            output["raw"] = str(results)[:1000]
+        elif include_raw:
+            output["raw"] = _REPR.repr(results)[:1000]
 
         return output
 
     except Exception as e:
-        _logger.error(f"Error formatting retrieval results: {e}")
-        return {"structured": None, "raw": str(results)}
\ No newline at end of file
+        _logger.error("Error formatting retrieval results: %s", e)
+        return {"structured": None, "raw": _REPR.repr(results)[:1000]}
\ No newline at end of file
@@ -1,64 +1,119 @@
 """Shared utilities, MCP tools, and model configuration."""
 
 import os
+import re
 import json
+import time
+import asyncio
 import logging
+import weakref
+import itertools
 import requests
-from typing import Dict, Any, List, Optional
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, Any, List, Mapping, Optional, Sequence, Tuple
+from immutabledict import immutabledict
+from google.adk.agents.readonly_context import ReadonlyContext
+from google.adk.tools.agent_tool import AgentTool
+from google.adk.tools.base_tool import BaseTool
+from google.adk.tools.base_toolset import BaseToolset
+from google.adk.tools.tool_context import ToolContext
 from google.adk.tools.mcp_tool import McpToolset, StreamableHTTPConnectionParams
 from google.adk.models.lite_llm import LiteLlm
+from google.genai import types
 
 _logger = logging.getLogger(__name__)
 
-def load_mcp_config() -> List[Dict[str, Any]]:
+# Pooled HTTP session for MCP probes; keeps connections alive across probes
+_HTTP = requests.Session()
+_HTTP.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+_HTTP.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=16))
+
+_CHART_RE = re.compile(
+    r"\b(?:charts?|graphs?|plots?|visuali[sz]e|bar|line|pie|scatter|histograms?)\b"
+)
+
+def query_needs_chart(query: str) -> bool:
+    """Return True if the user query asks for a chart or graph."""
+    return bool(_CHART_RE.search(query.lower()))
+
+def load_mcp_config() -> Tuple[Mapping[str, Any], ...]:
     """Load MCP servers configuration from environment."""
-    mcp_env = os.getenv("MCP_SERVERS_JSON")
+    return _parse_mcp_config(os.getenv("MCP_SERVERS_JSON"))
+
+@lru_cache(maxsize=1)
+def _parse_mcp_config(mcp_env: Optional[str]) -> Tuple[Mapping[str, Any], ...]:
+    """Parse MCP_SERVERS_JSON once per distinct value into immutable entries."""
     if not mcp_env:
         _logger.warning("MCP_SERVERS_JSON is not defined - MCP tools will not be available")
-        return []
+        return ()
     
     try:
         servers = json.loads(mcp_env)
         if not isinstance(servers, list):
             _logger.error("MCP_SERVERS_JSON must be a list")
-            return []
+            return ()
         
-        _logger.info(f"Loaded {len(servers)} MCP server configurations")
-        return servers
+        accepted = []
+        for index, server in enumerate(servers):
+            if isinstance(server, dict):
+                accepted.append(immutabledict(server))
+            else:
+                _logger.warning(
+                    "Skipping MCP_SERVERS_JSON entry %d: expected an object, got %s",
+                    index, type(server).__name__,
+                )
+
+        _logger.info("Loaded %d MCP server configurations", len(accepted))
+        return tuple(accepted)
         
     except json.JSONDecodeError as e:
-        _logger.error(f"Failed to parse MCP_SERVERS_JSON: {e}")
-        return []
+        _logger.error("Failed to parse MCP_SERVERS_JSON: %s", e)
+        return ()
 
-def get_model_config() -> Dict[str, Any]:
+def get_model_config() -> Mapping[str, Any]:
     """Get the model configuration based on environment variables."""
-    model_type = os.getenv("MODEL_TYPE", "vllm").lower()
-    deepseek_api_key = os.getenv("DEEPSEEK_API_KEY")
-    
+    return _build_model_config(
+        os.getenv("MODEL_TYPE", "vllm").lower(),
+        os.getenv("DEEPSEEK_API_KEY"),
+        os.getenv("VLLM_MODEL_NAME", "openai/mistral-large:123b"),
+        os.getenv("VLLM_BASE_URL", "http://localhost:9000/v1"),
+        os.getenv("VLLM_API_KEY", "EMPTY"),
+    )
+
+@lru_cache(maxsize=1)
+def _build_model_config(
+    model_type: str,
+    deepseek_api_key: Optional[str],
+    vllm_model_name: str,
+    vllm_base_url: str,
+    vllm_api_key: str,
+) -> Mapping[str, Any]:
+    """Build the model configuration once per distinct set of settings."""
     if model_type == "deepseek" or deepseek_api_key:
         _logger.info("Using DeepSeek model")
-        return {
+        return immutabledict({
             "type": "deepseek",
             "model": "deepseek/deepseek-chat",
             "api_key": deepseek_api_key,
             "name": "deepseek_agent"
-        }
+        })
     else:
-        _logger.info(f"Using vLLM model: {os.getenv('VLLM_MODEL_NAME', 'openai/mistral-large:123b')}")
-        return {
+        _logger.info("Using vLLM model: %s", vllm_model_name)
+        return immutabledict({
             "type": "vllm",
-            "model": os.getenv("VLLM_MODEL_NAME", "openai/mistral-large:123b"),
-            "api_base": os.getenv("VLLM_BASE_URL", "http://localhost:9000/v1"),
-            "api_key": os.getenv("VLLM_API_KEY", "EMPTY"),
+            "model": vllm_model_name,
+            "api_base": vllm_base_url,
+            "api_key": vllm_api_key,
             "name": "vllm_agent"
-        }
+        })
 
 def test_mcp_connection(
     url: str,
     *,
     requires_auth: bool = False,
-    auth_token: Optional[str] = None,
-    auth_scheme: str = "Bearer",
+    auth_headers: Optional[Mapping[str, str]] = None,
     timeout: int = 3,
 ) -> bool:
     """
@@ -66,38 +121,40 @@ def test_mcp_connection(
 
     Returns True if server is reachable, False if not.
     """
-    payload = {"jsonrpc": "2.0"}  # minimal JSON-RPC message
-
     headers = {
-        "Content-Type": "application/json",
         "Accept": "application/json,text/event-stream",
     }
 
     if requires_auth:
-        if not auth_token:
+        if not auth_headers:
             _logger.error("MCP auth required but token missing")
             return False
-        headers["Authorization"] = f"{auth_scheme} {auth_token}"
+        headers.update(auth_headers)
 
     try:
-        response = requests.post(
-            url,
-            headers=headers,
-            json=payload,
-            timeout=timeout,
-            stream=True,  # important for streamable HTTP
-        )
+        # HEAD needs no JSON-RPC dispatch or body on the server side
+        with _HTTP.head(
+            url, headers=headers, timeout=timeout, allow_redirects=False
+        ) as response:
+            status_code = response.status_code
+
+        if status_code == 501:
+            # HEAD not implemented; fall back to GET without reading the body
+            with _HTTP.get(
+                url, headers=headers, timeout=timeout, stream=True
+            ) as response:
+                status_code = response.status_code
 
         # Any response <500 is considered reachable
-        if response.status_code >= 500:
+        if status_code >= 500:
             _logger.error(
                 "MCP server %s returned server error: %s",
                 url,
-                response.status_code,
+                status_code,
             )
             return False
 
-        _logger.info("MCP server reachable: %s (status=%s)", url, response.status_code)
+        _logger.info("MCP server reachable: %s (status=%s)", url, status_code)
         return True
 
     except requests.exceptions.RequestException as exc:
@@ -105,58 +162,325 @@ def test_mcp_connection(
         return False
 
 
-def create_mcp_toolsets(servers: List[Dict[str, Any]]) -> List[McpToolset]:
-    toolsets = []
+# MCP server URL of every tool a LazyMcpToolset has loaded
+_TOOL_SERVER_URLS: "weakref.WeakKeyDictionary[BaseTool, str]" = weakref.WeakKeyDictionary()
+
+def mcp_tool_server_url(tool: BaseTool) -> Optional[str]:
+    """Return the URL of the MCP server a tool was loaded from, if any."""
+    return _TOOL_SERVER_URLS.get(tool)
+
+
+class LazyMcpToolset(McpToolset):
+    """
+    McpToolset that loads the server's tool schemas on first use and reuses them.
 
+    ADK asks every toolset for its tools before each LLM request, and the base
+    class answers with a fresh ``list_tools`` round-trip every time. Schemas
+    are cached here and reloaded on the first call after they are older
+    than ``schema_ttl`` seconds; if that reload fails the last known schemas
+    keep being served. The reload runs in the caller's task, never a detached
+    one.
+
+    One instance is shared by every agent in the process, but its MCP
+    sessions are not: AgentTool closes them at the end of the sub-agent call
+    that opened them, and the next call opens new ones. Only the schemas
+    outlive a call.
+    """
+
+    def __init__(self, *args, schema_ttl: float = 300.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._schema_ttl = schema_ttl
+        self._cached_tools: Optional[List[BaseTool]] = None
+        self._loaded_at = 0.0
+
+    async def get_tools(
+        self, readonly_context: Optional[ReadonlyContext] = None
+    ) -> List[BaseTool]:
+        if self._cached_tools is None:
+            try:
+                await self._load_tools(readonly_context)
+            except Exception as e:
+                _logger.error("Failed to load MCP tools: %s", e)
+                return []
+        elif time.monotonic() - self._loaded_at > self._schema_ttl:
+            try:
+                await self._load_tools(readonly_context)
+            except Exception as e:
+                _logger.warning("MCP tool refresh failed, serving cached schemas: %s", e)
+                self._loaded_at = time.monotonic()
+        return self._cached_tools
+
+    async def _load_tools(self, readonly_context: Optional[ReadonlyContext]) -> None:
+        tools = await super().get_tools(readonly_context)
+        for tool in tools:
+            _TOOL_SERVER_URLS[tool] = self._connection_params.url
+        self._cached_tools = tools
+        self._loaded_at = time.monotonic()
+
+
+@lru_cache(maxsize=None)
+def _make_toolset(url: str, requires_auth: bool, auth_header: Optional[str]) -> McpToolset:
+    """
+    Probe one MCP server and open its toolset.
+
+    Cached, so every agent built in this process shares one toolset (and its
+    schema cache) per server and credentials, and only the first build for a
+    server pays for the probe. An unreachable server raises ConnectionError,
+    which is not cached, so the next build probes it again.
+    """
+    auth_headers = {"Authorization": auth_header} if auth_header else None
+    if not test_mcp_connection(url, requires_auth=requires_auth, auth_headers=auth_headers):
+        raise ConnectionError(f"MCP server not reachable: {url}")
+
+    toolset = LazyMcpToolset(
+        connection_params=StreamableHTTPConnectionParams(url=url, headers=auth_headers),
+        schema_ttl=float(os.getenv("MCP_SCHEMA_TTL", "300")),
+    )
+    _logger.info("Created MCP toolset for: %s", url)
+    return toolset
+
+def create_mcp_toolsets(servers: Sequence[Mapping[str, Any]]) -> List[McpToolset]:
+    # One Authorization header for every authed server, shared by the probe
+    # and the connection params
+    token = os.getenv("MCP_AUTH_TOKEN")
+    scheme = os.getenv("MCP_AUTH_SCHEME", "Bearer")
+    auth_header = f"{scheme} {token}" if token else None
+
+    keys = []
     for server in servers:
-        url = server.get("url")
-        if not url:
+        if not server.get("url"):
             _logger.error("MCP server entry missing 'url'")
             continue
+        requires_auth = bool(server.get("auth", False))
+        keys.append((server["url"], requires_auth, auth_header if requires_auth else None))
+    if not keys:
+        return []
 
-        requires_auth = server.get("auth", False)
-        token = os.getenv("MCP_AUTH_TOKEN")
-        scheme = os.getenv("MCP_AUTH_SCHEME", "Bearer")
+    # New servers are probed concurrently, so startup waits for the slowest
+    # probe rather than the sum of all of them; known ones are cache hits
+    with ThreadPoolExecutor(max_workers=max(4, len(keys))) as executor:
+        futures = [executor.submit(_make_toolset, *key) for key in keys]
 
-        # Test connection
-        if not test_mcp_connection(
-            url,
-            requires_auth=requires_auth,
-            auth_token=token,
-            auth_scheme=scheme,
-        ):
+    # Keep input order
+    toolsets = []
+    for (url, _, _), future in zip(keys, futures):
+        try:
+            toolsets.append(future.result())
+        except ConnectionError:
+            # test_mcp_connection has logged why
             continue
+        except Exception as e:
+            _logger.error("Failed to create MCP toolset for %s: %s", url, e)
+
+    return toolsets
+
+class BoundedAgentTool(AgentTool):
+    """
+    AgentTool with bounded concurrency and a per-call timeout.
+
+    All sub-agent calls share one semaphore (SUB_AGENT_MAX_CONCURRENCY), and
+    each call gets SUB_AGENT_TIMEOUT seconds. A call that does not finish is
+    cancelled and returned to the orchestrator as an error instead of stalling
+    the turn. It is not retried: the sub-agent may already have made tool
+    calls and forwarded state changes.
+    """
+
+    _semaphore: Optional[asyncio.Semaphore] = None
+    _seqno = itertools.count(1)
+    _waiting = 0
+
+    def __init__(self, agent, **kwargs):
+        super().__init__(agent=agent, **kwargs)
+        self._timeout = float(os.getenv("SUB_AGENT_TIMEOUT", "120"))
 
-        headers = None
-        if requires_auth:
-            headers = {"Authorization": f"{scheme} {token}"}
+    @staticmethod
+    def _get_semaphore() -> asyncio.Semaphore:
+        # Created on first use, inside the serving event loop
+        if BoundedAgentTool._semaphore is None:
+            BoundedAgentTool._semaphore = asyncio.Semaphore(
+                int(os.getenv("SUB_AGENT_MAX_CONCURRENCY", "32"))
+            )
+        return BoundedAgentTool._semaphore
 
+    async def run_async(self, *, args: Dict[str, Any], tool_context: ToolContext) -> Any:
+        seqno = next(self._seqno)
+        semaphore = self._get_semaphore()
+        if semaphore.locked():
+            _logger.info(
+                "Sub-agent call #%d to %s queued behind %d others",
+                seqno, self.name, BoundedAgentTool._waiting,
+            )
+        BoundedAgentTool._waiting += 1
         try:
-            toolsets.append(
-                McpToolset(
-                    connection_params=StreamableHTTPConnectionParams(
-                        url=url,
-                        headers=headers
-                    )
-                )
+            await semaphore.acquire()
+        finally:
+            BoundedAgentTool._waiting -= 1
+
+        try:
+            return await asyncio.wait_for(
+                super().run_async(args=args, tool_context=tool_context),
+                timeout=self._timeout,
             )
-            _logger.info(f"Created MCP toolset for: {url}")
-        except Exception as e:
-            _logger.error(f"Failed to create MCP toolset for {url}: {e}")
+        except asyncio.TimeoutError:
+            _logger.warning(
+                "Sub-agent call #%d to %s timed out after %.0fs",
+                seqno, self.name, self._timeout,
+            )
+            # The cancelled call skipped AgentTool's runner.close()
+            await _close_agent_toolsets(self.agent)
+        finally:
+            semaphore.release()
 
-    return toolsets
+        return {"error": f"{self.name} did not respond within {self._timeout:.0f} seconds"}
+
+async def _close_agent_toolsets(agent) -> None:
+    """Close the toolsets of an agent tree, as ``Runner.close`` would."""
+    for tool in getattr(agent, "tools", ()):
+        if isinstance(tool, BaseToolset):
+            try:
+                await tool.close()
+            except Exception as e:
+                _logger.warning("Failed to close toolset %s: %s", type(tool).__name__, e)
+    for sub_agent in agent.sub_agents:
+        await _close_agent_toolsets(sub_agent)
 
-def get_lite_llm_model(model_config: Dict[str, Any]) -> LiteLlm:
-    """Create a LiteLlm instance from model configuration."""
-    if model_config["type"] == "deepseek":
+class McpBatchTool(BaseTool):
+    """
+    Single ``batch_execute`` tool that runs several MCP tool calls at once.
+
+    Calls are resolved by tool name across the given toolsets and dispatched
+    concurrently, at most ``max_concurrency`` at a time. A failing call is
+    reported in its own result entry and does not cancel the others.
+
+    ADK runs the agent's tool callbacks for ``batch_execute`` only, so the
+    agent passes them in as ``before_call``/``after_call`` (same signatures)
+    to have them applied to every inner call, failed ones included.
+    """
+
+    def __init__(
+        self,
+        toolsets: Sequence[McpToolset],
+        *,
+        max_concurrency: int = 4,
+        before_call: Optional[Callable[..., Optional[Dict[str, Any]]]] = None,
+        after_call: Optional[Callable[..., Optional[Dict[str, Any]]]] = None,
+    ):
+        super().__init__(
+            name="batch_execute",
+            description=(
+                "Run several MCP tool calls concurrently and return all results "
+                "in order. Use this when a request needs data from more than one "
+                "tool or system."
+            ),
+        )
+        self._toolsets = tuple(toolsets)
+        self._max_concurrency = max_concurrency
+        self._before_call = before_call
+        self._after_call = after_call
+        # Name -> tool map, rebuilt only when a toolset hands out new schemas
+        self._tool_lists: Tuple[List[BaseTool], ...] = ()
+        self._tools: Dict[str, BaseTool] = {}
+
+    def _get_declaration(self) -> types.FunctionDeclaration:
+        return types.FunctionDeclaration(
+            name=self.name,
+            description=self.description,
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "calls": types.Schema(
+                        type=types.Type.ARRAY,
+                        description="Tool calls to run.",
+                        items=types.Schema(
+                            type=types.Type.OBJECT,
+                            properties={
+                                "tool": types.Schema(
+                                    type=types.Type.STRING,
+                                    description="Name of the MCP tool to call.",
+                                ),
+                                "args": types.Schema(
+                                    type=types.Type.OBJECT,
+                                    description="Arguments for that tool.",
+                                ),
+                            },
+                            required=["tool"],
+                        ),
+                    ),
+                },
+                required=["calls"],
+            ),
+        )
+
+    async def _get_tool_map(self, tool_context: ToolContext) -> Dict[str, BaseTool]:
+        # LazyMcpToolset serves the same cached list until its schemas are
+        # reloaded, so this is normally a lookup with no MCP round-trip
+        tool_lists = tuple([await toolset.get_tools(tool_context) for toolset in self._toolsets])
+        if len(tool_lists) != len(self._tool_lists) or any(
+            new is not old for new, old in zip(tool_lists, self._tool_lists)
+        ):
+            tools: Dict[str, BaseTool] = {}
+            for tool_list in tool_lists:
+                for tool in tool_list:
+                    tools.setdefault(tool.name, tool)
+            self._tool_lists, self._tools = tool_lists, tools
+        return self._tools
+
+    async def run_async(self, *, args: Dict[str, Any], tool_context: ToolContext) -> Any:
+        tools = await self._get_tool_map(tool_context)
+        semaphore = asyncio.Semaphore(self._max_concurrency)
+
+        async def run_one(call: Mapping[str, Any]) -> Dict[str, Any]:
+            name = call.get("tool")
+            tool = tools.get(name)
+            if tool is None or tool is self:
+                return {"tool": name, "error": f"Unknown tool: {name}"}
+            call_args = call.get("args") or {}
+
+            result = None
+            if self._before_call:
+                result = self._before_call(tool, call_args, tool_context)
+            if result is None:
+                async with semaphore:
+                    try:
+                        result = await tool.run_async(
+                            args=call_args, tool_context=tool_context
+                        )
+                    except Exception as e:
+                        _logger.warning("Batched MCP call to %s failed: %s", name, e)
+                        error = {"error": str(e)}
+                        if self._after_call:
+                            self._after_call(tool, call_args, tool_context, error)
+                        return {"tool": name, **error}
+            if self._after_call:
+                result = self._after_call(tool, call_args, tool_context, result) or result
+            return {"tool": name, "result": result}
+
+        calls = args.get("calls") or []
+        _logger.info("Running %d batched MCP calls", len(calls))
+        return {"results": await asyncio.gather(*(run_one(call) for call in calls))}
+
+def get_lite_llm_model(model_config: Mapping[str, Any]) -> LiteLlm:
+    """Return the shared LiteLlm instance for a model configuration."""
+    return _build_lite_llm(
+        model_config["type"],
+        model_config["model"],
+        model_config.get("api_base"),
+        model_config.get("api_key", "EMPTY"),
+    )
+
+@lru_cache(maxsize=4)
+def _build_lite_llm(
+    model_type: str, model: str, api_base: Optional[str], api_key: Optional[str]
+) -> LiteLlm:
+    """Create one LiteLlm per distinct endpoint so all agents share its client."""
+    if model_type == "deepseek":
         return LiteLlm(
-            model=model_config["model"],
-            api_key=model_config["api_key"]
+            model=model,
+            api_key=api_key
         )
     else:
         return LiteLlm(
-            model=model_config["model"],
-            api_base=model_config.get("api_base"),
-            api_key=model_config.get("api_key", "EMPTY")
+            model=model,
+            api_base=api_base,
+            api_key=api_key
         )
-
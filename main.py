@@ -24,7 +24,9 @@ It is used for Cloud Run deployment with standard gcloud run deploy command.
 """
 
 import os
+import asyncio
 import logging
+import contextlib
 import uvicorn
 from dotenv import load_dotenv
 from fastapi import FastAPI
@@ -50,7 +52,10 @@ session_uri = os.getenv("SESSION_SERVICE_URI", None)
 web_interface_enabled = os.getenv("SERVE_WEB_INTERFACE", 'False').lower() in ('true', '1')
 
 # Prepare arguments for get_fast_api_app
-app_args = {"agents_dir": AGENT_DIR, "web": web_interface_enabled}
+app_args = {
+    "agents_dir": AGENT_DIR,
+    "web": web_interface_enabled,
+}
 
 # Only include session_service_uri if it's provided
 if session_uri:
@@ -67,37 +72,77 @@ app: FastAPI = get_fast_api_app(**app_args)
 app.title = "data_science"
 app.description = "Data Science Agent System"
 
-if __name__ == "__main__":
-    # Display agent information when starting
+def _load_root_agent():
+    """Build the exported root_agent; blocking, so run it off the event loop."""
     try:
-        # Try to import and display agent info
         from data_science.agent import root_agent
-        
-        print("=" * 70)
-        print("DATA SCIENCE AGENT SYSTEM")
-        print("=" * 70)
-        print(f"Root Agent: {root_agent.name}")
-        print(f"Description: {root_agent.description}")
-        
-        # Display sub-agents if available
-        if hasattr(root_agent, 'sub_agents') and root_agent.sub_agents:
-            print(f"Sub-agents: {[a.name for a in root_agent.sub_agents]}")
-        
-        # Display tools if available
-        if hasattr(root_agent, 'tools') and root_agent.tools:
-            print(f"Tools available: {[t.name for t in root_agent.tools]}")
-        
-        print("=" * 70)
-        print("\nStarting FastAPI server...")
-        print("Agent available via ADK web server:")
-        print("=" * 70)
-        
-    except ImportError as e:
-        print(f"Warning: Could not import agent details - {e}")
-        print("Starting FastAPI server without agent info display...")
+        return root_agent
+    except Exception:
+        logger.exception("Could not build the root agent")
+        return None
+
+
+def _print_agent_banner(root_agent) -> None:
+    """Display agent information."""
+    print("=" * 70)
+    print("DATA SCIENCE AGENT SYSTEM")
+    print("=" * 70)
+    print(f"Root Agent: {root_agent.name}")
+    print(f"Description: {root_agent.description}")
+    
+    # Display sub-agents if available
+    if hasattr(root_agent, 'sub_agents') and root_agent.sub_agents:
+        print(f"Sub-agents: {[a.name for a in root_agent.sub_agents]}")
     
+    # Display tools if available
+    if hasattr(root_agent, 'tools') and root_agent.tools:
+        print(f"Tools available: {[t.name for t in root_agent.tools]}")
+    
+    print("=" * 70)
+    print("Agent available via ADK web server")
+    print("=" * 70)
+
+
+def _add_agent_startup(app: FastAPI, *, banner: bool) -> None:
+    """Build root_agent before the server accepts requests, then show the banner."""
+    # ADK's app uses a lifespan, so on_event("startup") handlers never run;
+    # wrap the lifespan instead
+    adk_lifespan = app.router.lifespan_context
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: FastAPI):
+        async with adk_lifespan(app) as state:
+            # The build runs in a thread so the loop stays free, and it
+            # finishes before serving starts, so no request waits on it
+            root_agent = await asyncio.to_thread(_load_root_agent)
+            if banner and root_agent is not None:
+                _print_agent_banner(root_agent)
+            yield state
+
+    app.router.lifespan_context = lifespan
+
+
+# Print the banner only for `python main.py`; SERVE_BANNER=0 turns it off
+_add_agent_startup(
+    app,
+    banner=__name__ == "__main__" and os.getenv("SERVE_BANNER", "1") != "0",
+)
+
+
+if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     print(f"\nStarting server on http://0.0.0.0:{port}")
     print("Press Ctrl+C to stop\n")
     
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    # "auto" selects uvloop and httptools when they are installed;
+    # AGENT_LOOP=asyncio / AGENT_HTTP=h11 opt out
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run(
+        # Multiple workers each import the app themselves
+        "main:app" if workers > 1 else app,
+        host="0.0.0.0",
+        port=port,
+        loop=os.getenv("AGENT_LOOP", "auto"),
+        http=os.getenv("AGENT_HTTP", "auto"),
+        workers=workers,
+    )
@@ -0,0 +1,58 @@
+"""Tests for the root agent's query classification and dispatch plan."""
+
+import pytest
+
+from data_science.agent import determine_query_plan, determine_query_type
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "Chart the top 5 products by revenue",
+        "Visualize the bottom 10 stores for last quarter",
+        "Analyze which region has the highest churn",
+        "Compare how many orders each channel received",
+    ],
+)
+def test_small_result_analysis_is_fused(query):
+    assert determine_query_type(query) == "analysis"
+    assert determine_query_plan(query, "analysis") == "fused"
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "Analyze sales by region",
+        "Compare revenue per month for each store",
+        "Show me the trend in total sales",
+        "Give me insights on max and min order values",
+        "Plot the average order count per week",
+        "What patterns do you see in customer churn?",
+        "Chart the top products by revenue",
+    ],
+)
+def test_open_ended_analysis_stays_two_step(query):
+    assert determine_query_type(query) == "analysis"
+    assert determine_query_plan(query, "analysis") == "two_step"
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["List the top 5 customers", "How many orders were placed today?"],
+)
+def test_retrieval_is_never_fused(query):
+    assert determine_query_type(query) == "retrieval"
+    assert determine_query_plan(query, "retrieval") == "two_step"
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "What does churn rate mean?",
+        "Which of our data sources should I trust for revenue?",
+        "Show me how the retention score is defined",
+        "Can you get me an explanation of the pipeline?",
+    ],
+)
+def test_explanatory_questions_are_general(query):
+    assert determine_query_type(query) == "general"